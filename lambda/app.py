@@ -1,7 +1,11 @@
 import os
 import time
+import zlib
+from functools import lru_cache
 import boto3
 import requests
+from boto3.s3.transfer import TransferConfig
+from requests.adapters import HTTPAdapter
 
 BANREP_URL = (
     "https://totoro.banrep.gov.co/estadisticas-economicas/rest/"
@@ -9,28 +13,77 @@ BANREP_URL = (
 )
 
 S3_BUCKET = os.environ.get("S3_BUCKET", "dolar-raw-sebastian-10347")
-s3 = boto3.client("s3")
+GZIP_LEVEL = 6
+CHUNK_SIZE = 64 * 1024
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=8,
+)
+
+# Sesión HTTP reutilizada entre invocaciones "warm" (evita handshake TCP+TLS)
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+
+@lru_cache(maxsize=None)
+def _s3():
+    """Cliente S3 creado una sola vez, en la primera invocación."""
+    return boto3.client("s3")
+
+
+class _GzipReader:
+    """
+    File-like de solo lectura que comprime con gzip un iterador de bytes a
+    medida que se consume, sin tener el payload completo en memoria.
+    """
+
+    def __init__(self, chunks, compresslevel=GZIP_LEVEL):
+        self._chunks = iter(chunks)
+        self._comp = zlib.compressobj(compresslevel, zlib.DEFLATED, 31)  # wbits=31 => formato gzip
+        self._buf = bytearray()
+        self._eof = False
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+
+    def read(self, size=-1):
+        while not self._eof and (size is None or size < 0 or len(self._buf) < size):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._buf += self._comp.flush()
+                self._eof = True
+            else:
+                self.raw_bytes += len(chunk)
+                self._buf += self._comp.compress(chunk)
+        if size is None or size < 0:
+            size = len(self._buf)
+        out = bytes(self._buf[:size])
+        del self._buf[:size]
+        self.compressed_bytes += len(out)
+        return out
 
 
 def handler(event, context):
     """Lambda handler para descargar JSON crudo del BanRep y guardarlo en S3."""
-    resp = requests.get(BANREP_URL, timeout=30)
-    resp.raise_for_status()
-    raw_bytes = resp.content  # crudo, sin modificar
-
     ts = int(time.time())
-    key = f"dolar-{ts}.json"
+    key = f"dolar-{ts}.json.gz"
 
-    s3.put_object(
-        Bucket=S3_BUCKET,
-        Key=key,
-        Body=raw_bytes,
-        ContentType="application/json",
-    )
+    # El body (crudo, sin modificar) se comprime y sube en streaming vía multipart
+    with _SESSION.get(BANREP_URL, stream=True, timeout=30) as resp:
+        resp.raise_for_status()
+        body = _GzipReader(resp.iter_content(chunk_size=CHUNK_SIZE))
+        _s3().upload_fileobj(
+            body,
+            S3_BUCKET,
+            key,
+            ExtraArgs={"ContentType": "application/json", "ContentEncoding": "gzip"},
+            Config=TRANSFER_CONFIG,
+        )
 
     return {
         "bucket": S3_BUCKET,
         "key": key,
-        "size_bytes": len(raw_bytes),
+        "size_bytes": body.raw_bytes,
+        "compressed_bytes": body.compressed_bytes,
         "message": "OK",
     }
@@ -1,13 +1,45 @@
-import os, json, logging
+import os, gzip, logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import boto3, pymysql
+from decimal import Decimal
+from functools import lru_cache
+from itertools import chain, islice
+import boto3
+import ijson, orjson
+from botocore.config import Config
+
+try:
+    # mysqlclient (libmysqlclient, C) si viene en la capa de la Lambda; si no, PyMySQL.
+    # Solo se usa lo común a ambos: connect(), ping() sin argumentos y OperationalError
+    import MySQLdb as db_driver
+except ImportError:
+    import pymysql as db_driver
+
+try:
+    # backend en C (yajl2_c); si no está compilado, cae al backend por defecto
+    ijson = ijson.get_backend("yajl2_c")
+except Exception:
+    pass
 
 # ===== Logging =====
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-s3 = boto3.client("s3")
 TABLE = "dolar"  # sin tilde
+MAX_WORKERS = 32  # descargas S3 concurrentes
+# el pool HTTP del cliente debe alcanzar para todas las descargas concurrentes
+s3 = boto3.client("s3", config=Config(max_pool_connections=MAX_WORKERS))
+INSERT_BATCH = 1000  # filas por INSERT multi-VALUES
+STREAM_THRESHOLD = 8 * 1024 * 1024  # bytes; por encima se parsea en streaming con ijson
+RANGE_THRESHOLD = 16 * 1024 * 1024  # bytes; por encima se descarga por rangos en paralelo
+RANGE_PART_SIZE = 8 * 1024 * 1024
+RANGE_WORKERS = 8  # rangos en vuelo (memoria acotada a RANGE_WORKERS * RANGE_PART_SIZE)
+
+# Conexión reutilizada entre invocaciones "warm" de la Lambda
+_CONN = None
+# La tabla ya se creó/verificó en este contenedor (evita el DDL en cada invocación)
+_TABLE_READY = False
 
 
 def _read_env():
@@ -56,72 +88,362 @@ def _read_env():
     return host, user, passwd, dbname, port
 
 
-def handler(event, context):
-    try:
-        host, user, passwd, dbname, port = _read_env()
-        logger.info("[INIT] Conectando a MySQL host=%s user=%s db=%s port=%s", host, user, dbname, port)
+def _get_conn():
+    """
+    Devuelve la conexión MySQL cacheada a nivel de módulo. Valida con ping()
+    sin argumentos (MySQLdb no acepta reconnect=; PyMySQL reconecta por
+    defecto) y, si falla con OperationalError, abre una nueva.
+    """
+    global _CONN
+    if _CONN is not None:
+        try:
+            _CONN.ping()
+            return _CONN
+        except db_driver.OperationalError:
+            logger.warning("[DB] Conexión cacheada inválida, reconectando…")
+            _CONN = None
+
+    host, user, passwd, dbname, port = _read_env()
+    logger.info("[INIT] Conectando a MySQL host=%s user=%s db=%s port=%s", host, user, dbname, port)
+    _CONN = db_driver.connect(
+        host=host, user=user, password=passwd, database=dbname,
+        port=port, autocommit=True, charset="utf8mb4"
+    )
+    return _CONN
 
-        conn = pymysql.connect(
-            host=host, user=user, password=passwd, database=dbname,
-            port=port, autocommit=True, charset="utf8mb4"
+
+def _get_object(bucket, key, size=None):
+    """
+    Fase 1, dentro del worker (el cliente boto3 es thread-safe). `size` viene
+    del evento S3 (s3.object.size); si falta se pide con head_object. Los
+    objetos de hasta STREAM_THRESHOLD se descargan y leen completos aquí,
+    en paralelo; de los grandes solo se devuelve el tamaño y el stream se
+    abre recién en la fase 2, al procesarlos. Devuelve (size, raw).
+    """
+    if size is None:
+        size = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    logger.info("[S3] s3://%s/%s Tamaño del objeto: %s bytes", bucket, key, size)
+    if size > STREAM_THRESHOLD:
+        return size, None
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    size = obj["ContentLength"]
+    return size, _read_body(obj["Body"], size)
+
+
+class _RangeReader:
+    """
+    File-like de solo lectura que descarga el objeto con GETs por rango
+    (Range: bytes=lo-hi) en paralelo y entrega los bytes en orden.
+    """
+
+    def __init__(self, bucket, key, size):
+        self._bucket, self._key = bucket, key
+        self._ranges = deque(
+            (lo, min(lo + RANGE_PART_SIZE, size) - 1) for lo in range(0, size, RANGE_PART_SIZE)
         )
-        cur = conn.cursor()
+        self._pool = ThreadPoolExecutor(max_workers=RANGE_WORKERS)
+        self._pending = deque()
+        for _ in range(RANGE_WORKERS):
+            self._submit_next()
+        self._part, self._pos = b"", 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _fetch(self, lo, hi):
+        obj = s3.get_object(Bucket=self._bucket, Key=self._key, Range=f"bytes={lo}-{hi}")
+        return obj["Body"].read()
+
+    def _submit_next(self):
+        if self._ranges:
+            self._pending.append(self._pool.submit(self._fetch, *self._ranges.popleft()))
+
+    def _next_part(self):
+        if not self._pending:
+            self._pool.shutdown(wait=False)
+            return False
+        self._part, self._pos = self._pending.popleft().result(), 0
+        self._submit_next()
+        return True
+
+    def read(self, size=-1):
+        out = []
+        while size != 0:
+            if self._pos >= len(self._part) and not self._next_part():
+                break
+            end = len(self._part) if size < 0 else self._pos + size
+            chunk = self._part[self._pos:end]
+            self._pos += len(chunk)
+            out.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b"".join(out)
+
+    def close(self):
+        """Cancela los rangos pendientes y libera el pool (idempotente)."""
+        if self.closed:
+            return
+        self.closed = True
+        self._ranges.clear()
+        self._pending.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _iter_items(stream):
+    """
+    Itera los pares [epoch_ms, valor] directamente desde el stream con ijson,
+    sin leer el body completo ni construir la lista en memoria.
+    """
+    events = ijson.parse(stream)
+    first = next(events, None)
+    if first is None or first[1] != "start_array":
+        _not_a_list(first[1] if first else "vacío")
+    return ijson.items(chain([first], events), "item")
+
+
+def _stream_items(bucket, key, size, gz):
+    """
+    Generador sobre _iter_items. El body se abre en el primer next() (no antes:
+    no queda una conexión ociosa mientras se procesan los archivos previos);
+    si supera RANGE_THRESHOLD se arma con GETs por rango en paralelo. Se cierra
+    al agotarse o al cerrarse el generador, p. ej. si falla un INSERT a mitad
+    de archivo. GzipFile no cierra su fileobj, por eso el `with body`.
+    """
+    if size > RANGE_THRESHOLD:
+        body = _RangeReader(bucket, key, size)
+    else:
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+    with body:
+        if gz:
+            with gzip.GzipFile(fileobj=body) as stream:
+                yield from _iter_items(stream)
+        else:
+            yield from _iter_items(body)
+
+
+def _read_body(body, size):
+    """
+    Lee el body completo con readinto sobre un bytearray prealocado de
+    `size` bytes (una sola reserva, sin concatenar bloques). orjson y gzip
+    aceptan el bytearray directamente. La lectura final hasta EOF es la que
+    dispara en botocore la validación de checksum y de Content-Length.
+    """
+    if not hasattr(body, "readinto"):
+        return body.read()
+    buf = bytearray(size)
+    view = memoryview(buf)
+    off = 0
+    while off < size:
+        n = body.readinto(view[off:])
+        if not n:
+            raise IOError(f"Body incompleto: {off} de {size} bytes")
+        off += n
+    if body.read(1):
+        raise IOError(f"Body más largo que los {size} bytes esperados")
+    return buf
+
 
-        # Crear tabla si no existe
-        logger.info("[DB] Creando tabla %s si no existe…", TABLE)
+def _load_items(bucket, key, size, raw=None):
+    """
+    Objetos chicos: `raw` es el body ya leído por _get_object; se parsea
+    con orjson (bytes directo, sin decode).
+    Objetos grandes (raw=None): streaming con ijson (ver _stream_items).
+    Las keys .gz (subidas por app.handler) se descomprimen al vuelo.
+    """
+    gz = key.endswith(".gz")
+    if raw is None:
+        return _stream_items(bucket, key, size, gz)
+    data = orjson.loads(gzip.decompress(raw) if gz else raw)
+    if not isinstance(data, list):
+        _not_a_list(type(data).__name__)
+    return data
+
+
+def _not_a_list(tipo):
+    raise ValueError(f"JSON debe ser lista de listas [[epoch_ms, valor], ...]. Recibido: {tipo}")
+
+
+def _to_decimal(val):
+    """
+    Valor como Decimal para la columna DECIMAL(12,4): PyMySQL lo envía como
+    literal exacto, sin pasar por float. Acepta str/int/float/Decimal.
+    """
+    d = Decimal(str(val))
+    if not d.is_finite():
+        raise ValueError(f"Valor no finito: {val!r}")
+    return d
+
+
+def _parse_rows(items, start=0, bad=0):
+    """
+    Convierte [[epoch_ms, valor], ...] en filas (fechahora, valor) y descarta
+    las inválidas, registrando hasta 5 en total. `start` y `bad` permiten
+    llamarla por bloques (índice del primer item e inválidas acumuladas).
+    Devuelve (rows, inválidas acumuladas).
+    """
+    rows = []
+    append, fromts, to_dec = rows.append, datetime.fromtimestamp, _to_decimal
+    it = enumerate(items, start)
+    # El try envuelve el for completo (no cada fila): ante una fila inválida se
+    # registra y el for se reanuda en la siguiente, porque `it` es el mismo iterador.
+    while True:
+        try:
+            for idx, item in it:
+                ts_ms, val = item  # ["1757509256000","3920"]
+                append((fromts(int(ts_ms) // 1000), to_dec(val)))  # datetime: PyMySQL lo escapa como DATETIME
+            return rows, bad
+        except Exception as e:
+            bad += 1
+            if bad <= 5:
+                logger.warning("[PARSE] Fila inválida idx=%d item=%r err=%s", idx, item, e)
+
+
+@lru_cache(maxsize=None)
+def _insert_sql(n):
+    """SQL del INSERT multi-VALUES para n filas (se arma una vez por tamaño de bloque)."""
+    values = ", ".join(["(%s, %s)"] * n)
+    return (
+        f"INSERT INTO {TABLE} (fechahora, valor) VALUES {values} AS new "
+        "ON DUPLICATE KEY UPDATE valor = new.valor;"  # alias de fila: MySQL >= 8.0.19
+    )
+
+
+def _insert_rows(cur, rows):
+    """
+    Inserta las filas con un único INSERT multi-VALUES por bloque de
+    INSERT_BATCH filas (un round trip por bloque en vez de uno por fila).
+    Re-procesar un archivo actualiza el valor en vez de duplicar la fila.
+    """
+    for start in range(0, len(rows), INSERT_BATCH):
+        chunk = rows[start:start + INSERT_BATCH]
+        params = [v for row in chunk for v in row]
+        cur.execute(_insert_sql(len(chunk)), params)
+
+
+def _has_pk(cur):
+    cur.execute(
+        "SELECT COUNT(*) FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = 'PRIMARY';",
+        (TABLE,),
+    )
+    return cur.fetchone()[0] > 0
+
+
+def _ensure_table(cur):
+    """
+    Crea la tabla si no existe. Si ya existía sin PRIMARY KEY (versión
+    anterior), la migra: copia a una tabla nueva con PK en fechahora,
+    deduplicando, y la intercambia con un RENAME atómico. Sin la PK el
+    ON DUPLICATE KEY UPDATE no deduplica y las consultas por rango de main.py
+    recorren la tabla completa. GET_LOCK evita que dos contenedores migren a la vez.
+    """
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLE} (
+          fechahora DATETIME NOT NULL PRIMARY KEY,
+          valor DECIMAL(12,4) NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+    """)
+    if _has_pk(cur):
+        return
+
+    lock = f"{TABLE}_pk_migracion"
+    cur.execute("SELECT GET_LOCK(%s, 60);", (lock,))
+    if cur.fetchone()[0] != 1:
+        raise RuntimeError(f"No se obtuvo el lock {lock} para migrar {TABLE}")
+    try:
+        if _has_pk(cur):  # otro contenedor ya migró mientras se esperaba el lock
+            return
+        logger.warning("[DB] %s sin PRIMARY KEY: deduplicando y agregando PK (fechahora)…", TABLE)
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE}_pk;")
         cur.execute(f"""
-            CREATE TABLE IF NOT EXISTS {TABLE} (
-              fechahora DATETIME NOT NULL,
+            CREATE TABLE {TABLE}_pk (
+              fechahora DATETIME NOT NULL PRIMARY KEY,
               valor DECIMAL(12,4) NOT NULL
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
         """)
+        # los duplicados son re-inserciones del mismo dato de BanRep: basta uno por fechahora
+        cur.execute(
+            f"INSERT INTO {TABLE}_pk (fechahora, valor) "
+            f"SELECT fechahora, MAX(valor) FROM {TABLE} GROUP BY fechahora;"
+        )
+        cur.execute(f"RENAME TABLE {TABLE} TO {TABLE}_sin_pk, {TABLE}_pk TO {TABLE};")
+        cur.execute(f"DROP TABLE {TABLE}_sin_pk;")
+    finally:
+        cur.execute("SELECT RELEASE_LOCK(%s);", (lock,))
+        cur.fetchone()
+
+
+def handler(event, context):
+    global _TABLE_READY
+    try:
+        conn = _get_conn()
+        cur = conn.cursor()
+
+        # Crear / migrar la tabla (solo en la primera invocación del contenedor)
+        if not _TABLE_READY:
+            logger.info("[DB] Creando tabla %s si no existe…", TABLE)
+            _ensure_table(cur)
+            _TABLE_READY = True
 
         total = 0
         details = []
         records = event.get("Records", [])
         logger.info("[EVENT] Records recibidos: %d", len(records))
 
+        # Fase 1: filtra keys y descarga en paralelo los objetos chicos (preserva el orden)
+        targets = []
         for i, rec in enumerate(records, start=1):
             bucket = rec["s3"]["bucket"]["name"]
             key = rec["s3"]["object"]["key"]
             logger.info("[S3] (%d/%d) s3://%s/%s", i, len(records), bucket, key)
 
             # Evita procesar artefactos de Zappa u otros archivos
-            if not (key.startswith("dolar-") and key.endswith(".json")):
-                logger.info("[SKIP] Key no coincide con dolar-*.json: %s", key)
+            if not (key.startswith("dolar-") and key.endswith((".json", ".json.gz"))):
+                logger.info("[SKIP] Key no coincide con dolar-*.json[.gz]: %s", key)
                 continue
+            targets.append((bucket, key, rec["s3"]["object"].get("size")))
+
+        fetched = []
+        if targets:
+            with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(targets))) as pool:
+                fetched = list(pool.map(lambda t: _get_object(*t), targets))
+
+        # Fase 2: parseo e inserción en orden
+        for (bucket, key, _), (size, raw) in zip(targets, fetched):
+            # Parseo e inserción por bloques: no se materializan todas las filas
+            items = iter(_load_items(bucket, key, size, raw))
+            inserted, bad, start = 0, 0, 0
+            try:
+                while True:
+                    chunk = list(islice(items, INSERT_BATCH))
+                    if not chunk:
+                        break
+                    rows, bad = _parse_rows(chunk, start, bad)
+                    start += len(chunk)
+                    if rows:
+                        _insert_rows(cur, rows)
+                        inserted += len(rows)
+            finally:
+                # en streaming `items` es un generador: cerrarlo libera el body / rangos
+                close = getattr(items, "close", None)
+                if close is not None:
+                    close()
+
+            logger.info("[PARSE] válidas=%d inválidas=%d", inserted, bad)
 
-            obj = s3.get_object(Bucket=bucket, Key=key)
-            size = obj.get("ContentLength")
-            logger.info("[S3] Tamaño del objeto: %s bytes", size)
-
-            data = json.loads(obj["Body"].read().decode("utf-8", "ignore"))
-            if not isinstance(data, list):
-                raise ValueError(f"JSON debe ser lista de listas [[epoch_ms, valor], ...]. Recibido: {type(data).__name__}")
-
-            rows, bad = [], 0
-            for idx, item in enumerate(data):
-                try:
-                    ts_ms, val = item  # ["1757509256000","3920"]
-                    dt = datetime.fromtimestamp(int(ts_ms)/1000).strftime("%Y-%m-%d %H:%M:%S")
-                    rows.append((dt, float(val)))
-                except Exception as e:
-                    bad += 1
-                    if bad <= 5:
-                        logger.warning("[PARSE] Fila inválida idx=%d item=%r err=%s", idx, item, e)
-
-            logger.info("[PARSE] válidas=%d inválidas=%d", len(rows), bad)
-
-            if rows:
-                cur.executemany(f"INSERT INTO {TABLE} (fechahora, valor) VALUES (%s, %s);", rows)
-                total += len(rows)
-                details.append({"bucket": bucket, "key": key, "rows_inserted": len(rows)})
-                logger.info("[DB] Insertadas %d filas desde %s", len(rows), key)
+            if inserted:
+                total += inserted
+                details.append({"bucket": bucket, "key": key, "rows_inserted": inserted})
+                logger.info("[DB] Insertadas %d filas desde %s", inserted, key)
             else:
                 logger.warning("[SKIP] Sin filas válidas en %s", key)
 
-        cur.close()
-        conn.close()
+        cur.close()  # la conexión queda abierta para la próxima invocación
         logger.info("[DONE] Archivos procesados: %d | Filas insertadas: %d", len(details), total)
         return {"files_processed": len(details), "total_rows_inserted": total, "details": details}
 
@@ -1,10 +1,17 @@
 # app.py
 import os
+import threading
 from typing import List
 from datetime import datetime
 
-import pymysql
+try:
+    # mysqlclient (libmysqlclient, C) si está instalado; si no, PyMySQL.
+    # Solo se usa lo común a ambos: connect(), ping() sin argumentos y OperationalError
+    import MySQLdb as db_driver
+except ImportError:
+    import pymysql as db_driver
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
 # --- Cargar .env (usa ruta explícita si quieres) ---
@@ -34,17 +41,27 @@ class IntervalResponse(BaseModel):
     data: List[Point]
 
 # ---------- App ----------
-app = FastAPI(title="Dolar API", version="1.0.0")
+app = FastAPI(title="Dolar API", version="1.0.0", default_response_class=ORJSONResponse)
+
+# Una conexión por hilo del threadpool de FastAPI, reutilizada entre requests
+_local = threading.local()
 
 def get_conn():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        try:
+            # sin argumentos: MySQLdb no acepta reconnect= (PyMySQL reconecta por defecto)
+            conn.ping()
+            return conn
+        except db_driver.OperationalError:
+            _local.conn = None
     try:
-        return pymysql.connect(
+        _local.conn = db_driver.connect(
             host=os.environ["MYSQL_HOST"],
             user=os.environ["MYSQL_USER"],
             password=os.environ["MYSQL_PASS"],
             database=os.environ["MYSQL_DB"],
             port=int(os.environ.get("MYSQL_PORT", "3306")),
-            cursorclass=pymysql.cursors.DictCursor,
             charset="utf8mb4",
             autocommit=True,
             connect_timeout=10,
@@ -53,6 +70,7 @@ def get_conn():
         )
     except KeyError as e:
         raise HTTPException(status_code=500, detail=f"Variable de entorno faltante: {e}")
+    return _local.conn
 
 @app.get("/health")
 def health():
@@ -75,12 +93,13 @@ def query_interval(payload: IntervalRequest):
 
     try:
         conn = get_conn()
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(sql, (start_str, end_str))
-                rows = cur.fetchall()
+        with conn.cursor() as cur:
+            cur.execute(sql, (start_str, end_str))
+            rows = cur.fetchall()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error consultando la base de datos: {e}")
 
-    data = [{"fechahora": r["fechahora"], "valor": float(r["valor"])} for r in rows]
-    return {"count": len(data), "data": data}
+    # filas como tuplas (fechahora, valor); se serializan directo con orjson,
+    # sin validar cada punto con Pydantic (response_model queda para la doc)
+    data = [{"fechahora": f, "valor": float(v)} for f, v in rows]
+    return ORJSONResponse({"count": len(data), "data": data})
@@ -0,0 +1,169 @@
+import io
+import importlib
+
+import boto3
+import pytest
+from fastapi.testclient import TestClient
+from moto import mock_aws
+
+# ============================================================
+# Credenciales AWS falsas para toda la sesión: sin ellas botocore intenta
+# resolverlas por red (IMDS) al crear clientes, lo que --disable-socket bloquea
+# ============================================================
+
+@pytest.fixture(scope="session", autouse=True)
+def _aws_creds():
+    mp = pytest.MonkeyPatch()
+    mp.setenv("AWS_ACCESS_KEY_ID", "testing")
+    mp.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    mp.setenv("AWS_SESSION_TOKEN", "testing")
+    mp.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    yield
+    mp.undo()
+
+
+@pytest.fixture(scope="session")
+def s3_client(_aws_creds):
+    """Cliente S3 de moto creado una vez por sesión (los buckets persisten entre tests)."""
+    with mock_aws():
+        yield boto3.client("s3", region_name="us-east-1")
+
+
+# ============================================================
+# Módulos bajo prueba: se importan una sola vez por sesión
+# ============================================================
+
+@pytest.fixture(scope="session")
+def main_mod():
+    return importlib.import_module("main")
+
+
+@pytest.fixture(scope="session")
+def app_mod():
+    return importlib.import_module("lambda.app")
+
+
+@pytest.fixture(scope="session")
+def sub_mod():
+    return importlib.import_module("lambda.subirDB")
+
+
+@pytest.fixture(scope="module")
+def client(main_mod):
+    with TestClient(main_mod.app) as c:
+        yield c
+
+
+# ============================================================
+# S3 en memoria (reemplaza a moto donde basta put/get)
+# ============================================================
+
+class FakeS3:
+    """
+    Lo mínimo del cliente S3 que usa subirDB: put_object, head_object y
+    get_object (con Range). `calls` registra (operación, key, Range).
+    """
+
+    def __init__(self):
+        self._objects = {}
+        self.calls = []
+
+    def put_object(self, Bucket, Key, Body, **extra):
+        self._objects[(Bucket, Key)] = (bytes(Body), extra)
+
+    def head_object(self, Bucket, Key):
+        self.calls.append(("head_object", Key, None))
+        body, extra = self._objects[(Bucket, Key)]
+        return {"ContentLength": len(body), **extra}
+
+    def get_object(self, Bucket, Key, Range=None):
+        self.calls.append(("get_object", Key, Range))
+        body, extra = self._objects[(Bucket, Key)]
+        if Range:
+            lo, hi = Range[len("bytes="):].split("-")
+            body = body[int(lo):int(hi) + 1]
+        return {"Body": io.BytesIO(body), "ContentLength": len(body), **extra}
+
+
+@pytest.fixture
+def fake_s3():
+    return FakeS3()
+
+
+# ============================================================
+# Fakes para DB (db_driver: MySQLdb o PyMySQL) usados en subirDB y main
+# ============================================================
+
+# env mínima válida para _read_env / get_conn
+ENV_OK = {"MYSQL_HOST": "localhost", "MYSQL_USER": "root", "MYSQL_PASS": "secret", "MYSQL_DB": "testdb"}
+
+
+class FakeCursor:
+    def __init__(self, rows=None):
+        self.executed = []
+        self._rows = rows or []
+        self.one = []  # respuestas de fetchone(), en orden
+        self.closed = False
+
+    # --- context manager support ---
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        # no suprimir excepciones
+        return False
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchall(self):
+        return self._rows
+
+    def fetchone(self):
+        return self.one.pop(0) if self.one else None
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConn:
+    def __init__(self, rows=None):
+        self.cursor_obj = FakeCursor(rows=rows)
+        self.closed = False
+        self.ping_error = None  # excepción a lanzar en ping() (conexión caída)
+
+    def cursor(self):
+        return self.cursor_obj
+
+    def ping(self, reconnect=True, /):
+        # solo posicional, como _mysql.connection.ping de mysqlclient (METH_VARARGS)
+        if self.ping_error is not None:
+            raise self.ping_error
+
+    # --- context manager support ---
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_connect(main_mod, sub_mod, monkeypatch):
+    """Reemplaza connect() del driver de main y subirDB; devuelve las FakeConn creadas."""
+    for k, v in ENV_OK.items():
+        monkeypatch.setenv(k, v)
+    conns = []
+
+    def connect(**kwargs):
+        conns.append(FakeConn())
+        return conns[-1]
+
+    monkeypatch.setattr(main_mod.db_driver, "connect", connect)
+    monkeypatch.setattr(sub_mod.db_driver, "connect", connect)
+    return conns
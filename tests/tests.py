@@ -1,84 +1,36 @@
-import os
+import io
+import gzip
 import json
-import importlib
+import threading
 from datetime import datetime
+from decimal import Decimal
 
 import pytest
-from moto import mock_aws
-import boto3
-from freezegun import freeze_time
-from fastapi.testclient import TestClient
+from botocore.exceptions import FlexibleChecksumError
+from botocore.httpchecksum import Crc32Checksum, StreamingChecksumBody
 
-# ============================================================
-# Fakes para DB (pymysql) usados en subirDB y main
-# ============================================================
-
-class FakeCursor:
-    def __init__(self, rows=None):
-        self.executed = []
-        self.executemany_calls = []
-        self._rows = rows or []
-        self.closed = False
-
-    # --- context manager support ---
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc, tb):
-        self.close()
-        # no suprimir excepciones
-        return False
-
-    def execute(self, sql, params=None):
-        self.executed.append((sql, params))
-
-    def executemany(self, sql, seq_of_params):
-        self.executemany_calls.append((sql, list(seq_of_params)))
-
-    def fetchall(self):
-        return self._rows
-
-    def close(self):
-        self.closed = True
-
-
-class FakeConn:
-    def __init__(self, rows=None):
-        self.cursor_obj = FakeCursor(rows=rows)
-        self.closed = False
-
-    def cursor(self):
-        return self.cursor_obj
-
-    # --- context manager support ---
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc, tb):
-        self.close()
-        return False
-
-    def close(self):
-        self.closed = True
+from conftest import ENV_OK, FakeConn, FakeCursor
 
+# Payload de prueba del handler de subirDB (se arma una sola vez)
+_DATA = [
+    ["1757509256000", "3920.00"],
+    ["1757509266000", "3921.50"],
+]
+_DATA_JSON = json.dumps(_DATA).encode("utf-8")
+_TS = [datetime.fromtimestamp(int(r[0]) // 1000) for r in _DATA]
 
 # ============================================================
 # Tests app.py (paquete: lambda.app)
 # ============================================================
 
-@mock_aws
-@freeze_time("2024-01-02 03:04:05")
-def test_lambda_app_handler_uploads_raw_to_s3(requests_mock, monkeypatch):
-    # AWS fake
-    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
-    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
-    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
-
-    s3 = boto3.client("s3", region_name="us-east-1")
-    os.environ["S3_BUCKET"] = "dolar-raw-test"
-    s3.create_bucket(Bucket=os.environ["S3_BUCKET"])
+def test_lambda_app_handler_uploads_raw_to_s3(app_mod, s3_client, requests_mock, monkeypatch):
+    # cliente moto compartido por la sesión: el bucket debe ser único por test
+    s3 = s3_client
+    bucket = "dolar-raw-test"
+    s3.create_bucket(Bucket=bucket)
 
-    app_mod = importlib.import_module("lambda.app")
+    # S3_BUCKET se lee al importar: se parchea en el módulo (el orden de import varía con xdist)
+    monkeypatch.setattr(app_mod, "S3_BUCKET", bucket)
 
     raw_payload = b'[["1757509256000","3920.12"],["1757509266000","3921.55"]]'
     requests_mock.get(app_mod.BANREP_URL, content=raw_payload, status_code=200)
@@ -87,86 +39,71 @@ def test_lambda_app_handler_uploads_raw_to_s3(requests_mock, monkeypatch):
     monkeypatch.setattr("time.time", lambda: 1704164645)
 
     res = app_mod.handler({}, {})
-    assert res["bucket"] == os.environ["S3_BUCKET"]
+    assert res["bucket"] == bucket
     assert res["message"] == "OK"
-    assert res["key"] == "dolar-1704164645.json"
+    assert res["key"] == "dolar-1704164645.json.gz"
     assert res["size_bytes"] == len(raw_payload)
+    assert res["compressed_bytes"] > 0
 
     obj = s3.get_object(Bucket=res["bucket"], Key=res["key"])
-    assert obj["Body"].read() == raw_payload
+    assert gzip.decompress(obj["Body"].read()) == raw_payload
     assert obj["ContentType"] == "application/json"
+    assert obj["ContentEncoding"] == "gzip"
+
+
+def test_lambda_app_gzip_reader_streams_chunks(app_mod):
+    chunks = [b'[["1757509256000",', b'"3920.12"]', b"]"]
+    reader = app_mod._GzipReader(chunks)
+    parts = []
+    while True:
+        part = reader.read(7)
+        if not part:
+            break
+        parts.append(part)
+    assert gzip.decompress(b"".join(parts)) == b"".join(chunks)
+    assert reader.raw_bytes == sum(len(c) for c in chunks)
+    assert reader.compressed_bytes == sum(len(p) for p in parts)
 
 
 # ============================================================
 # Tests subirDB.py (paquete: lambda.subirDB)
 # ============================================================
 
-def test_subirdb_read_env_ok(monkeypatch):
-    sub_mod = importlib.import_module("lambda.subirDB")
-    monkeypatch.setenv("MYSQL_HOST", "localhost")
-    monkeypatch.setenv("MYSQL_USER", "root")
-    monkeypatch.setenv("MYSQL_PASS", "secret")
-    monkeypatch.setenv("MYSQL_DB", "testdb")
-    monkeypatch.setenv("MYSQL_PORT", "3307")
-    host, user, passwd, dbname, port = sub_mod._read_env()
-    assert (host, user, passwd, dbname, port) == ("localhost", "root", "secret", "testdb", 3307)
-
-def test_subirdb_read_env_missing(monkeypatch):
-    sub_mod = importlib.import_module("lambda.subirDB")
-    for k in ["MYSQL_HOST","MYSQL_USER","MYSQL_PASS","MYSQL_DB","DB_HOST","DB_USER","DB_PASS","DB_NAME"]:
+_ENV_KEYS = [
+    "MYSQL_HOST", "MYSQL_USER", "MYSQL_PASS", "MYSQL_DB", "MYSQL_NAME", "MYSQL_PORT",
+    "DB_HOST", "DB_USER", "DB_PASS", "DB_NAME", "DB_PORT",
+]
+
+@pytest.mark.parametrize("env,err_substr", [
+    ({**ENV_OK, "MYSQL_PORT": "3307"}, None),
+    ({}, "ENV faltantes"),
+    ({**ENV_OK, "MYSQL_HOST": "${MYSQL_HOST}"}, "placeholders"),
+    ({**ENV_OK, "MYSQL_PORT": "not-int"}, "inválido"),
+], ids=["ok", "missing", "placeholders", "bad_port"])
+def test_subirdb_read_env(sub_mod, monkeypatch, env, err_substr):
+    for k in _ENV_KEYS:
         monkeypatch.delenv(k, raising=False)
-    with pytest.raises(RuntimeError) as e:
-        sub_mod._read_env()
-    assert "ENV faltantes" in str(e.value)
-
-def test_subirdb_read_env_placeholders(monkeypatch):
-    sub_mod = importlib.import_module("lambda.subirDB")
-    monkeypatch.setenv("MYSQL_HOST", "${MYSQL_HOST}")
-    monkeypatch.setenv("MYSQL_USER", "root")
-    monkeypatch.setenv("MYSQL_PASS", "x")
-    monkeypatch.setenv("MYSQL_DB", "db")
-    with pytest.raises(RuntimeError) as e:
-        sub_mod._read_env()
-    assert "placeholders" in str(e.value)
-
-def test_subirdb_read_env_bad_port(monkeypatch):
-    sub_mod = importlib.import_module("lambda.subirDB")
-    monkeypatch.setenv("MYSQL_HOST", "localhost")
-    monkeypatch.setenv("MYSQL_USER", "root")
-    monkeypatch.setenv("MYSQL_PASS", "x")
-    monkeypatch.setenv("MYSQL_DB", "db")
-    monkeypatch.setenv("MYSQL_PORT", "not-int")
-    with pytest.raises(RuntimeError) as e:
-        sub_mod._read_env()
-    assert "inválido" in str(e.value).lower()
-
-@mock_aws
-def test_subirdb_handler_happy_path(monkeypatch):
-    import importlib
-
-    # 1) AWS fake/creds antes de importar el módulo
-    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
-    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
-    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
-
-    # 2) Cliente S3 de moto y bucket
-    s3 = boto3.client("s3", region_name="us-east-1")
+    for k, v in env.items():
+        monkeypatch.setenv(k, v)
+
+    if err_substr is None:
+        assert sub_mod._read_env() == ("localhost", "root", "secret", "testdb", 3307)
+    else:
+        with pytest.raises(RuntimeError) as e:
+            sub_mod._read_env()
+        assert err_substr in str(e.value)
+
+def test_subirdb_handler_happy_path(sub_mod, fake_s3, monkeypatch):
+    # 1) S3 en memoria como cliente s3 del módulo
+    s3 = fake_s3
     bucket = "dolar-raw-test2"
-    s3.create_bucket(Bucket=bucket)
-
-    # 3) Importa el módulo y parchea su cliente s3 por el de moto
-    sub_mod = importlib.import_module("lambda.subirDB")
     monkeypatch.setattr(sub_mod, "s3", s3)
 
-    # 4) Sube objeto de prueba
-    data = [
-        ["1757509256000", "3920.00"],
-        ["1757509266000", "3921.50"],
-    ]
+    # 2) Sube objeto de prueba
     s3.put_object(
         Bucket=bucket,
         Key="dolar-123.json",
-        Body=json.dumps(data).encode("utf-8"),
+        Body=_DATA_JSON,
         ContentType="application/json",
     )
 
@@ -177,32 +114,227 @@ def test_subirdb_handler_happy_path(monkeypatch):
         ]
     }
 
-    # 5) ENV DB
+    # 3) ENV DB
     monkeypatch.setenv("MYSQL_HOST", "localhost")
     monkeypatch.setenv("MYSQL_USER", "root")
     monkeypatch.setenv("MYSQL_PASS", "secret")
     monkeypatch.setenv("MYSQL_DB", "db")
     monkeypatch.setenv("MYSQL_PORT", "3306")
 
-    # 6) Fake pymysql.connect
+    # 4) Fake db_driver.connect
     fake_conn = FakeConn()
-    monkeypatch.setattr(sub_mod.pymysql, "connect", lambda **kwargs: fake_conn)
+    fake_conn.cursor_obj.one = [(1,)]  # la tabla ya tiene PRIMARY KEY
+    monkeypatch.setattr(sub_mod, "_CONN", None)
+    monkeypatch.setattr(sub_mod, "_TABLE_READY", False)
+    monkeypatch.setattr(sub_mod.db_driver, "connect", lambda **kwargs: fake_conn)
 
-    # 7) Ejecutar
+    # 5) Ejecutar
     res = sub_mod.handler(event, {})
 
-    # 8) Asserts
+    # 6) Asserts
     assert res["files_processed"] == 1
     assert res["total_rows_inserted"] == 2
     executed = "".join(sql for sql, _ in fake_conn.cursor_obj.executed)
     assert "CREATE TABLE IF NOT EXISTS dolar" in executed
-    assert len(fake_conn.cursor_obj.executemany_calls) == 1
-    insert_sql, rows = fake_conn.cursor_obj.executemany_calls[0]
-    assert "INSERT INTO dolar (fechahora, valor)" in insert_sql
+    assert "fechahora DATETIME NOT NULL PRIMARY KEY" in executed
+    inserts = [(sql, params) for sql, params in fake_conn.cursor_obj.executed if "INSERT" in sql]
+    assert len(inserts) == 1
+    insert_sql, params = inserts[0]
+    assert "INSERT INTO dolar (fechahora, valor) VALUES (%s, %s), (%s, %s)" in insert_sql
+    assert "AS new ON DUPLICATE KEY UPDATE valor = new.valor" in insert_sql
+    assert not any("RENAME TABLE" in sql for sql, _ in fake_conn.cursor_obj.executed)
+
+    assert params == [_TS[0], Decimal("3920.00"), _TS[1], Decimal("3921.50")]
+    assert all(isinstance(p, Decimal) for p in params[1::2])
+
+    # 7) Invocación "warm": reutiliza la conexión y no repite el CREATE TABLE
+    fake_conn.cursor_obj.executed.clear()
+    sub_mod.handler(event, {})
+    assert not any("CREATE TABLE" in sql for sql, _ in fake_conn.cursor_obj.executed)
+
+
+def test_subirdb_ensure_table_migrates_table_without_pk(sub_mod):
+    cur = FakeCursor()
+    # sin PK -> GET_LOCK ok -> sigue sin PK tras el lock -> RELEASE_LOCK
+    cur.one = [(0,), (1,), (0,), (1,)]
+    sub_mod._ensure_table(cur)
+
+    sqls = [" ".join(sql.split()) for sql, _ in cur.executed]
+    assert sqls[0].startswith("CREATE TABLE IF NOT EXISTS dolar (")
+    assert sqls[2].startswith("SELECT GET_LOCK(")
+    assert "INSERT INTO dolar_pk (fechahora, valor) SELECT fechahora, MAX(valor) FROM dolar GROUP BY fechahora;" in sqls
+    assert "RENAME TABLE dolar TO dolar_sin_pk, dolar_pk TO dolar;" in sqls
+    assert sqls[-2:] == ["DROP TABLE dolar_sin_pk;", "SELECT RELEASE_LOCK(%s);"]
+    assert not cur.one
+
+    # otro contenedor migró mientras se esperaba el lock: no se copia nada
+    cur = FakeCursor()
+    cur.one = [(0,), (1,), (1,), (1,)]
+    sub_mod._ensure_table(cur)
+    assert not any("RENAME" in sql for sql, _ in cur.executed)
+    assert cur.executed[-1][0] == "SELECT RELEASE_LOCK(%s);"
+
+
+def test_subirdb_get_conn_reuses_and_rebuilds(sub_mod, fake_connect, monkeypatch):
+    monkeypatch.setattr(sub_mod, "_CONN", None)
+    conn = sub_mod._get_conn()
+    # ping() de FakeConn es solo posicional, como el de mysqlclient
+    with pytest.raises(TypeError):
+        conn.ping(reconnect=True)
+    assert sub_mod._get_conn() is conn
+    assert len(fake_connect) == 1
+
+    # ping falla => se descarta la conexión cacheada y se abre otra
+    conn.ping_error = sub_mod.db_driver.OperationalError(2006, "MySQL server has gone away")
+    new_conn = sub_mod._get_conn()
+    assert new_conn is not conn
+    assert len(fake_connect) == 2
+    assert sub_mod._get_conn() is new_conn
+
+
+def test_subirdb_parse_rows_skips_bad_rows(sub_mod):
+    good = ["1757509256000", "3920.00"]
+    ts = datetime.fromtimestamp(int(good[0]) // 1000)
+    assert sub_mod._parse_rows([good]) == ([(ts, Decimal("3920.00"))], 0)
+    assert sub_mod._parse_rows([good, ["x", "1"], [1], ["1757509256000", "NaN"]]) == ([(ts, Decimal("3920.00"))], 3)
+    # timestamp fuera del rango de datetime: fila inválida
+    rows, bad = sub_mod._parse_rows([good, ["999999999999999999", "2"]])
+    assert (rows, bad) == ([(ts, Decimal("3920.00"))], 1)
+    assert all(isinstance(r[0], datetime) for r in rows)
+    assert sub_mod._parse_rows([["x", "1"]], start=1000, bad=3) == ([], 4)
+
+
+def test_subirdb_insert_rows_batches(sub_mod, monkeypatch):
+    monkeypatch.setattr(sub_mod, "INSERT_BATCH", 2)
+    cur = FakeCursor()
+    rows = [(datetime(2025, 1, 1, 0, m), float(m)) for m in range(3)]
+    sub_mod._insert_rows(cur, rows)
+    assert [sql.count("(%s, %s)") for sql, _ in cur.executed] == [2, 1]
+    assert [p for _, params in cur.executed for p in params] == [v for r in rows for v in r]
+
+
+@pytest.mark.parametrize("threshold", [0, 1024])
+def test_subirdb_load_items_gzip(sub_mod, fake_s3, monkeypatch, threshold):
+    monkeypatch.setattr(sub_mod, "s3", fake_s3)
+    monkeypatch.setattr(sub_mod, "STREAM_THRESHOLD", threshold)  # 0 => ruta ijson
+    fake_s3.put_object(Bucket="b", Key="dolar-1.json.gz", Body=gzip.compress(b'[["1757509256000","3920"]]'))
+    size, raw = sub_mod._get_object("b", "dolar-1.json.gz")
+    assert list(sub_mod._load_items("b", "dolar-1.json.gz", size, raw)) == [["1757509256000", "3920"]]
+
+
+def test_subirdb_load_items_byte_ranges(sub_mod, fake_s3, monkeypatch):
+    s3 = fake_s3
+    bucket = "dolar-raw-test3"
+
+    monkeypatch.setattr(sub_mod, "s3", s3)
+    monkeypatch.setattr(sub_mod, "STREAM_THRESHOLD", 0)
+    monkeypatch.setattr(sub_mod, "RANGE_THRESHOLD", 0)
+    monkeypatch.setattr(sub_mod, "RANGE_PART_SIZE", 7)
+    monkeypatch.setattr(sub_mod, "RANGE_WORKERS", 2)
+
+    data = [[str(1757509256000 + i * 1000), f"{3920 + i}.50"] for i in range(20)]
+    s3.put_object(Bucket=bucket, Key="dolar-456.json", Body=json.dumps(data).encode("utf-8"))
+
+    size, raw = sub_mod._get_object(bucket, "dolar-456.json")
+    assert raw is None
+    assert list(sub_mod._load_items(bucket, "dolar-456.json", size, raw)) == data
+    # un solo HEAD y luego solo GETs por rango: ningún GET completo descartado
+    assert s3.calls[0] == ("head_object", "dolar-456.json", None)
+    assert all(op == "get_object" and rng for op, _, rng in s3.calls[1:])
+
+
+def test_subirdb_handler_closes_range_reader_on_error(sub_mod, fake_s3, fake_connect, monkeypatch):
+    bucket = "dolar-raw-test4"
+    monkeypatch.setattr(sub_mod, "s3", fake_s3)
+    monkeypatch.setattr(sub_mod, "_CONN", None)
+    monkeypatch.setattr(sub_mod, "_TABLE_READY", True)
+    monkeypatch.setattr(sub_mod, "STREAM_THRESHOLD", 0)
+    monkeypatch.setattr(sub_mod, "RANGE_THRESHOLD", 0)
+    monkeypatch.setattr(sub_mod, "RANGE_PART_SIZE", 7)
+    monkeypatch.setattr(sub_mod, "RANGE_WORKERS", 2)
+    monkeypatch.setattr(sub_mod, "INSERT_BATCH", 5)
+
+    readers = []
+
+    class SpyReader(sub_mod._RangeReader):
+        def __init__(self, *args):
+            super().__init__(*args)
+            readers.append(self)
+
+    monkeypatch.setattr(sub_mod, "_RangeReader", SpyReader)
+
+    def failing_execute(sql, params=None):
+        raise RuntimeError("INSERT falló")
+
+    data = [[str(1757509256000 + i * 1000), f"{3920 + i}.50"] for i in range(20)]
+    fake_s3.put_object(Bucket=bucket, Key="dolar-789.json", Body=json.dumps(data).encode("utf-8"))
+    event = {"Records": [{"s3": {"bucket": {"name": bucket}, "object": {"key": "dolar-789.json"}}}]}
+
+    sub_mod._get_conn().cursor_obj.execute = failing_execute
+    with pytest.raises(RuntimeError, match="INSERT falló"):
+        sub_mod.handler(event, {})
+
+    # el primer lote falla con rangos aún pendientes: el reader debe quedar cerrado
+    assert len(readers) == 1
+    assert readers[0].closed
+    assert not readers[0]._pending and not readers[0]._ranges
+    assert readers[0]._pool._shutdown
 
-    ts1 = datetime.fromtimestamp(int(data[0][0]) / 1000).strftime("%Y-%m-%d %H:%M:%S")
-    ts2 = datetime.fromtimestamp(int(data[1][0]) / 1000).strftime("%Y-%m-%d %H:%M:%S")
-    assert rows == [(ts1, 3920.0), (ts2, 3921.5)]
+
+def test_subirdb_get_object_reads_small_bodies_in_worker(sub_mod, fake_s3, monkeypatch):
+    monkeypatch.setattr(sub_mod, "s3", fake_s3)
+    monkeypatch.setattr(sub_mod, "STREAM_THRESHOLD", len(_DATA_JSON))
+    fake_s3.put_object(Bucket="b", Key="dolar-small.json", Body=_DATA_JSON)
+    fake_s3.put_object(Bucket="b", Key="dolar-big.json", Body=_DATA_JSON + b" ")
+
+    # tamaño tomado del evento S3: sin head_object, un único GET
+    size, raw = sub_mod._get_object("b", "dolar-small.json", len(_DATA_JSON))
+    assert raw == _DATA_JSON  # ya descargado dentro del worker
+    assert fake_s3.calls == [("get_object", "dolar-small.json", None)]
+    assert sub_mod._load_items("b", "dolar-small.json", size, raw) == _DATA
+
+    fake_s3.calls.clear()
+    size, raw = sub_mod._get_object("b", "dolar-big.json")
+    assert raw is None  # se difiere al streaming con ijson
+    assert fake_s3.calls == [("head_object", "dolar-big.json", None)]
+    items = sub_mod._load_items("b", "dolar-big.json", size, raw)
+    assert len(fake_s3.calls) == 1  # el stream se abre recién al consumir
+    assert list(items) == _DATA
+    assert fake_s3.calls[1] == ("get_object", "dolar-big.json", None)
+
+
+def test_subirdb_s3_pool_fits_max_workers(sub_mod):
+    assert sub_mod.s3.meta.config.max_pool_connections == sub_mod.MAX_WORKERS
+
+
+def test_subirdb_read_body_prealloc(sub_mod):
+    payload = b'[["1757509256000","3920"]]'
+    assert sub_mod._read_body(io.BytesIO(payload), len(payload)) == payload
+    with pytest.raises(IOError):
+        sub_mod._read_body(io.BytesIO(payload), len(payload) + 10)
+    with pytest.raises(IOError):
+        sub_mod._read_body(io.BytesIO(payload + b" "), len(payload))
+
+
+def test_subirdb_read_body_validates_checksum(sub_mod):
+    payload = b'[["1757509256000","3920"]]'
+    good = Crc32Checksum()
+    good.update(payload)
+
+    body = StreamingChecksumBody(io.BytesIO(payload), len(payload), Crc32Checksum(), good.b64digest())
+    assert sub_mod._read_body(body, len(payload)) == payload
+
+    body = StreamingChecksumBody(io.BytesIO(payload), len(payload), Crc32Checksum(), "AAAAAA==")
+    with pytest.raises(FlexibleChecksumError):
+        sub_mod._read_body(body, len(payload))
+
+
+def test_subirdb_iter_items_rejects_non_list(sub_mod):
+    items = list(sub_mod._iter_items(io.BytesIO(b'[["1757509256000","3920"]]')))
+    assert items == [["1757509256000", "3920"]]
+    with pytest.raises(ValueError) as e:
+        sub_mod._iter_items(io.BytesIO(b'{"a": 1}'))
+    assert "lista de listas" in str(e.value)
 
 
 
@@ -210,34 +342,48 @@ def test_subirdb_handler_happy_path(monkeypatch):
 # Tests main.py (raíz)
 # ============================================================
 
-def test_fastapi_health():
-    main_mod = importlib.import_module("main")
-    client = TestClient(main_mod.app)
+def test_fastapi_get_conn_reuses_and_rebuilds(main_mod, fake_connect, monkeypatch):
+    monkeypatch.setattr(main_mod, "_local", threading.local())
+    conn = main_mod.get_conn()
+    assert main_mod.get_conn() is conn
+    assert len(fake_connect) == 1
+
+    conn.ping_error = main_mod.db_driver.OperationalError(2006, "MySQL server has gone away")
+    new_conn = main_mod.get_conn()
+    assert new_conn is not conn
+    assert len(fake_connect) == 2
+    assert main_mod.get_conn() is new_conn
+
+    # otro hilo del threadpool tiene su propia conexión
+    other = []
+    t = threading.Thread(target=lambda: other.append(main_mod.get_conn()))
+    t.start()
+    t.join()
+    assert other[0] is not new_conn
+    assert len(fake_connect) == 3
+
+def test_fastapi_health(client):
     r = client.get("/health")
     assert r.status_code == 200
     assert r.json() == {"status": "ok"}
 
-def test_fastapi_intervalo_bad_range():
-    main_mod = importlib.import_module("main")
-    client = TestClient(main_mod.app)
+def test_fastapi_intervalo_bad_range(client):
     now = datetime(2025, 1, 1, 12, 0, 0)
     payload = {"start": now.isoformat(), "end": now.isoformat()}
     r = client.post("/api/v1/dolar/intervalo", json=payload)
     assert r.status_code == 400
     assert "`end` debe ser mayor" in r.json()["detail"]
 
-def test_fastapi_intervalo_ok(monkeypatch):
-    main_mod = importlib.import_module("main")
-
+def test_fastapi_intervalo_ok(main_mod, client, monkeypatch):
     # filas simuladas
     rows = [
-        {"fechahora": datetime(2025, 1, 1, 10, 0, 0), "valor": 3900.12},
-        {"fechahora": datetime(2025, 1, 1, 10, 5, 0), "valor": 3901.34},
-        {"fechahora": datetime(2025, 1, 1, 10, 10, 0), "valor": 3899.99},
+        (datetime(2025, 1, 1, 10, 0, 0), Decimal("3900.1200")),
+        (datetime(2025, 1, 1, 10, 5, 0), Decimal("3901.3400")),
+        (datetime(2025, 1, 1, 10, 10, 0), Decimal("3899.9900")),
     ]
+    # get_conn se resuelve en cada request: el parche aplica con el client compartido
     monkeypatch.setattr(main_mod, "get_conn", lambda: FakeConn(rows=rows))
 
-    client = TestClient(main_mod.app)
     payload = {"start": "2025-01-01T09:59:00", "end": "2025-01-01T10:11:00"}
     r = client.post("/api/v1/dolar/intervalo", json=payload)
     assert r.status_code == 200
@@ -247,3 +393,4 @@ def test_fastapi_intervalo_ok(monkeypatch):
     assert vals == [3900.12, 3901.34, 3899.99]
     fechas = [d["fechahora"] for d in body["data"]]
     assert fechas == sorted(fechas)
+    assert fechas[0] == "2025-01-01T10:00:00"